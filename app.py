@@ -62,6 +62,7 @@ from models import (
     create_token,
     consume_token,
     purge_expired_tokens,
+    start_token_purger,
     get_token_info,
 )
 
@@ -92,6 +93,10 @@ ADMIN_SECRET_TOKEN = os.environ.get("ADMIN_SECRET_TOKEN", "change-me-admin-secre
 # Initialize DB (creates file + tables if not present)
 init_db(app.config["DATABASE"])
 
+# Expired tokens are purged in the background rather than on the request path
+app.config["TOKEN_PURGE_INTERVAL"] = int(os.environ.get("TOKEN_PURGE_INTERVAL", 600))
+start_token_purger(app.config["DATABASE"], interval=app.config["TOKEN_PURGE_INTERVAL"])
+
 # Messaging / reporting tables will be ensured after init_db below
 
 login_manager = LoginManager()
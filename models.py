@@ -1,8 +1,12 @@
 # models.py
 import sqlite3
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime, timezone
+import atexit
 import os
 import secrets
+import threading
+import time
 
 def _row_factory(cursor, row):
     d = {}
@@ -10,37 +14,109 @@ def _row_factory(cursor, row):
         d[col[0]] = row[idx]
     return d
 
+# Pooled connections, one per (thread, db_path). Helpers reuse the same warm
+# connection (and its page cache) instead of opening/closing the file per call.
+_POOL = {}
+_POOL_LOCK = threading.Lock()
+
+# Applied once when a pooled connection is created
+_CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA foreign_keys=ON",
+)
+
+def _configure_connection(conn):
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+
+# Per-cursor row factory for single-column queries: no dict per row
+def _first_column(cursor, row):
+    return row[0]
+
 def get_connection(db_path):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = _row_factory
+    key = (threading.get_ident(), db_path)
+    conn = _POOL.get(key)
+    if conn is None:
+        with _POOL_LOCK:
+            conn = _POOL.get(key)
+            if conn is None:
+                # check_same_thread=False so close_connections() can run from the exit hook
+                conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=256)
+                conn.row_factory = _row_factory
+                _configure_connection(conn)
+                _POOL[key] = conn
     return conn
 
+def close_connections():
+    with _POOL_LOCK:
+        for conn in _POOL.values():
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _POOL.clear()
+        _SCHEMA_CACHE.clear()
+    with _READ_CACHE_LOCK:
+        _USER_CACHE.clear()
+        _JOB_CACHE.clear()
+
+atexit.register(close_connections)
+
+# (id(conn), table) -> set of column names, filled lazily from PRAGMA table_info
+_SCHEMA_CACHE = {}
+
 def _columns_for_table(conn, table):
-    cur = conn.cursor()
-    cur.execute(f"PRAGMA table_info('{table}')")
-    return [r['name'] for r in cur.fetchall()]
+    key = (id(conn), table)
+    columns = _SCHEMA_CACHE.get(key)
+    if columns is None:
+        cur = conn.execute("SELECT name FROM pragma_table_info(?)", (table,))
+        cur.row_factory = _first_column
+        columns = set(cur.fetchall())
+        _SCHEMA_CACHE[key] = columns
+    return columns
 
 def _table_exists(conn, table):
-    cur = conn.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = ?", (table,))
+    cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = ?", (table,))
     return cur.fetchone() is not None
 
 def _ensure_table(conn, create_sql):
-    cur = conn.cursor()
-    cur.execute(create_sql)
+    conn.execute(create_sql)
     conn.commit()
 
 def _add_column_if_missing(conn, table, column_def):  # column_def example: "is_banned INTEGER NOT NULL DEFAULT 0"
     col_name = column_def.split()[0]
     existing = _columns_for_table(conn, table)
     if col_name not in existing:
-        cur = conn.cursor()
-        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
         conn.commit()
+        existing.add(col_name)
         return True
     return False
 
+_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_jobs_employer ON jobs(employer_id, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_created_id ON jobs(created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_apps_job ON applications(job_id, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_apps_user ON applications(user_id, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_ratings_target ON ratings(target_type, target_id, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_tokens_expires_ts ON tokens(expires_ts)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username)",
+)
+
+# Rating target_type -> table holding its rating_sum/rating_count
+_RATING_TARGET_TABLES = {"job": "jobs", "user": "users"}
+
+# db_paths init_db has already run for in this process
+_INITIALIZED = set()
+
 def init_db(db_path):
+    if db_path in _INITIALIZED:
+        return
+
     # Ensure DB directory exists
     db_dir = os.path.dirname(db_path)
     if db_dir and not os.path.exists(db_dir):
@@ -124,6 +200,7 @@ def init_db(db_path):
             email TEXT NOT NULL,
             purpose TEXT NOT NULL,
             expires_at DATETIME,
+            expires_ts INTEGER,
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     """,
@@ -138,299 +215,424 @@ def init_db(db_path):
         # Log but continue
         print("models.init_db: failed to add application file columns:", e)
 
-    conn.close()
+    try:
+        # users: profile/verification columns read by the user helpers below
+        _add_column_if_missing(conn, "users", "username TEXT")
+        _add_column_if_missing(conn, "users", "first_name TEXT")
+        _add_column_if_missing(conn, "users", "last_name TEXT")
+        _add_column_if_missing(conn, "users", "verified INTEGER NOT NULL DEFAULT 0")
+    except sqlite3.OperationalError as e:
+        print("models.init_db: failed to add user profile columns:", e)
+
+    try:
+        # tokens: unix-epoch expiry so expiry checks are integer compares; backfill from expires_at
+        if _add_column_if_missing(conn, "tokens", "expires_ts INTEGER"):
+            conn.execute(
+                "UPDATE tokens SET expires_ts = CAST(strftime('%s', expires_at) AS INTEGER) WHERE expires_at IS NOT NULL"
+            )
+            conn.commit()
+    except sqlite3.OperationalError as e:
+        print("models.init_db: failed to add token expiry column:", e)
+
+    try:
+        # jobs/users: running rating totals maintained by the rating helpers; backfill on first add
+        for target_type, table in _RATING_TARGET_TABLES.items():
+            added = _add_column_if_missing(conn, table, "rating_sum INTEGER NOT NULL DEFAULT 0")
+            _add_column_if_missing(conn, table, "rating_count INTEGER NOT NULL DEFAULT 0")
+            if added:
+                conn.execute(
+                    f"""UPDATE {table} SET
+                        rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM ratings WHERE target_type = ? AND target_id = {table}.id),
+                        rating_count = (SELECT COUNT(*) FROM ratings WHERE target_type = ? AND target_id = {table}.id)""",
+                    (target_type, target_type),
+                )
+                conn.commit()
+    except sqlite3.OperationalError as e:
+        print("models.init_db: failed to add rating aggregate columns:", e)
+
+    # Indexes for the hot WHERE/ORDER BY columns used by the helpers below
+    try:
+        for index_sql in _INDEXES:
+            conn.execute(index_sql)
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        print("models.init_db: failed to create indexes:", e)
+
+    _INITIALIZED.add(db_path)
 
 # ---- helper functions for app logic below ----
 
+# Small LRU caches for the hot point lookups (get_user_by_id runs on every request
+# via the login loader). Keyed by (db_path, id); each entry remembers the pooled
+# connection that filled it and that connection's PRAGMA data_version, read before
+# the row was fetched. data_version changes whenever any other connection (another
+# thread or another worker process) commits, so a hit is only served while nothing
+# else has written since; writes made through this connection invalidate entries
+# explicitly in the helpers below. Callers get copies, never the cached dict.
+_READ_CACHE_SIZE = 1024
+_USER_CACHE = OrderedDict()
+_JOB_CACHE = OrderedDict()
+_READ_CACHE_LOCK = threading.Lock()
+
+def _data_version(conn):
+    cur = conn.execute("PRAGMA data_version")
+    cur.row_factory = _first_column
+    return cur.fetchone()
+
+def _cache_get(cache, key, conn):
+    with _READ_CACHE_LOCK:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        owner, version, row = entry
+        if owner is not conn:
+            return None
+        cache.move_to_end(key)
+    if _data_version(conn) != version:
+        return None
+    return dict(row)
+
+def _cache_put(cache, key, conn, version, row):
+    with _READ_CACHE_LOCK:
+        cache[key] = (conn, version, dict(row))
+        cache.move_to_end(key)
+        if len(cache) > _READ_CACHE_SIZE:
+            cache.popitem(last=False)
+
+def _cache_discard(cache, key):
+    with _READ_CACHE_LOCK:
+        cache.pop(key, None)
+
+def _discard_user_by_email(db_path, email):
+    with _READ_CACHE_LOCK:
+        stale = [k for k, (_, _, row) in _USER_CACHE.items() if k[0] == db_path and row.get("email") == email]
+        for k in stale:
+            del _USER_CACHE[k]
+
+def _discard_jobs_for_db(db_path):
+    with _READ_CACHE_LOCK:
+        for k in [k for k in _JOB_CACHE if k[0] == db_path]:
+            del _JOB_CACHE[k]
+
 # Users
 def create_user(db_path, email, password_hash, role="candidate", username=None, first_name=None, last_name=None, verified=0):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        """INSERT INTO users
-           (email,password_hash,role,username,first_name,last_name,verified,created_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-        (email, password_hash, role, username, first_name, last_name, verified, datetime.utcnow().isoformat()),
-    )
-    conn.commit()
-    user_id = cur.lastrowid
-    conn.close()
-    return get_user_by_id(db_path, user_id)
+    with conn:
+        cur = conn.execute(
+            """INSERT INTO users
+               (email,password_hash,role,username,first_name,last_name,verified,created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               RETURNING id, email, role, is_banned, banned_until, created_at, username, first_name, last_name, verified""",
+            (email, password_hash, role, username, first_name, last_name, verified, datetime.utcnow().isoformat()),
+        )
+        row = cur.fetchone()
+    return row
 
 def get_user_by_email(db_path, email):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT id, email, password_hash, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users WHERE email = ?", (email,))
+    cur = conn.execute("SELECT id, email, password_hash, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users WHERE email = ?", (email,))
     row = cur.fetchone()
-    conn.close()
     return row
 
 def get_user_by_username(db_path, username):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT id, email, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users WHERE username = ?", (username,))
+    cur = conn.execute("SELECT id, email, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users WHERE username = ?", (username,))
     row = cur.fetchone()
-    conn.close()
     return row
 
 def get_user_by_id(db_path, id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT id, email, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users WHERE id = ?", (id,))
+    cached = _cache_get(_USER_CACHE, (db_path, id), conn)
+    if cached is not None:
+        return cached
+    version = _data_version(conn)
+    cur = conn.execute("SELECT id, email, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users WHERE id = ?", (id,))
     row = cur.fetchone()
-    conn.close()
+    if row:
+        _cache_put(_USER_CACHE, (db_path, id), conn, version, row)
     return row
 
+def _user_email_exists(conn, email):
+    cur = conn.execute("SELECT 1 FROM users WHERE email = ?", (email,))
+    return cur.fetchone() is not None
+
 def set_user_verified(db_path, email):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET verified = 1 WHERE email = ?", (email,))
-    conn.commit()
-    updated = cur.rowcount
-    conn.close()
-    return updated > 0
+    # Skip the page write when the user is already verified
+    with conn:
+        cur = conn.execute("UPDATE users SET verified = 1 WHERE email = ? AND verified <> 1", (email,))
+    if cur.rowcount > 0:
+        _discard_user_by_email(db_path, email)
+        return True
+    return _user_email_exists(conn, email)
 
 def update_user_password(db_path, email, password_hash):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET password_hash = ? WHERE email = ?", (password_hash, email))
-    conn.commit()
-    updated = cur.rowcount
-    conn.close()
-    return updated > 0
+    # Skip the page write when the stored hash is already this one
+    with conn:
+        cur = conn.execute(
+            "UPDATE users SET password_hash = ? WHERE email = ? AND password_hash <> ?",
+            (password_hash, email, password_hash),
+        )
+    if cur.rowcount > 0:
+        _discard_user_by_email(db_path, email)
+        return True
+    return _user_email_exists(conn, email)
 
 def get_all_users(db_path):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT id, email, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users ORDER BY created_at DESC")
+    cur = conn.execute("SELECT id, email, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users ORDER BY created_at DESC")
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 def set_user_ban(db_path, user_id, banned_until_iso=None):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    if banned_until_iso:
-        cur.execute("UPDATE users SET is_banned=1, banned_until=? WHERE id = ?", (banned_until_iso, user_id))
-    else:
-        cur.execute("UPDATE users SET is_banned=1, banned_until=NULL WHERE id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    with conn:
+        if banned_until_iso:
+            conn.execute("UPDATE users SET is_banned=1, banned_until=? WHERE id = ?", (banned_until_iso, user_id))
+        else:
+            conn.execute("UPDATE users SET is_banned=1, banned_until=NULL WHERE id = ?", (user_id,))
+    _cache_discard(_USER_CACHE, (db_path, user_id))
     return True
 
 def unset_user_ban(db_path, user_id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET is_banned=0, banned_until=NULL WHERE id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute("UPDATE users SET is_banned=0, banned_until=NULL WHERE id = ?", (user_id,))
+    _cache_discard(_USER_CACHE, (db_path, user_id))
     return True
 
 def delete_user(db_path, user_id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM applications WHERE user_id = ?", (user_id,))
-    cur.execute("DELETE FROM ratings WHERE rater_id = ? OR (target_type='user' AND target_id=?)", (user_id, user_id))
-    cur.execute("SELECT id FROM jobs WHERE employer_id = ?", (user_id,))
-    job_ids = [r['id'] for r in cur.fetchall()]
-    for jid in job_ids:
-        cur.execute("DELETE FROM applications WHERE job_id = ?", (jid,))
-        cur.execute("DELETE FROM ratings WHERE target_type='job' AND target_id = ?", (jid,))
-    cur.execute("DELETE FROM jobs WHERE employer_id = ?", (user_id,))
-    cur.execute("DELETE FROM users WHERE id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    # One transaction; the user's jobs are cleared set-wise rather than per job id
+    with conn:
+        conn.execute("DELETE FROM applications WHERE user_id = ?", (user_id,))
+        # Take the user's ratings back out of the totals of whatever they rated
+        for target_type, table in _RATING_TARGET_TABLES.items():
+            conn.execute(
+                f"""UPDATE {table} SET
+                    rating_sum = rating_sum - (SELECT COALESCE(SUM(rating), 0) FROM ratings WHERE target_type = ? AND target_id = {table}.id AND rater_id = ?),
+                    rating_count = rating_count - (SELECT COUNT(*) FROM ratings WHERE target_type = ? AND target_id = {table}.id AND rater_id = ?)
+                    WHERE id IN (SELECT target_id FROM ratings WHERE target_type = ? AND rater_id = ?)""",
+                (target_type, user_id, target_type, user_id, target_type, user_id),
+            )
+        conn.execute("DELETE FROM ratings WHERE rater_id = ? OR (target_type='user' AND target_id=?)", (user_id, user_id))
+        conn.execute("DELETE FROM applications WHERE job_id IN (SELECT id FROM jobs WHERE employer_id = ?)", (user_id,))
+        conn.execute("DELETE FROM ratings WHERE target_type='job' AND target_id IN (SELECT id FROM jobs WHERE employer_id = ?)", (user_id,))
+        conn.execute("DELETE FROM jobs WHERE employer_id = ?", (user_id,))
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    _cache_discard(_USER_CACHE, (db_path, user_id))
+    # The user's jobs went with them
+    _discard_jobs_for_db(db_path)
     return True
 
 # Tokens: DB-backed hex tokens for email verification and password reset
 def create_token(db_path, email, purpose, expires_seconds=3600):
     conn = get_connection(db_path)
-    cur = conn.cursor()
     token = secrets.token_hex(24)  # 48 hex chars (~192 bits)
-    expires_at = (datetime.utcnow() + timedelta(seconds=expires_seconds)).isoformat()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS tokens (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            token TEXT UNIQUE NOT NULL,
-            email TEXT NOT NULL,
-            purpose TEXT NOT NULL,
-            expires_at TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )""")
-    cur.execute(
-        "INSERT INTO tokens (token, email, purpose, expires_at) VALUES (?, ?, ?, ?)",
-        (token, email, purpose, expires_at),
-    )
-    conn.commit()
-    conn.close()
+    expires_ts = int(time.time()) + expires_seconds
+    expires_at = datetime.fromtimestamp(expires_ts, timezone.utc).replace(tzinfo=None).isoformat()
+    with conn:
+        conn.execute(
+            "INSERT INTO tokens (token, email, purpose, expires_at, expires_ts) VALUES (?, ?, ?, ?, ?)",
+            (token, email, purpose, expires_at, expires_ts),
+        )
     return token
 
 def consume_token(db_path, token, purpose):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT email, expires_at FROM tokens WHERE token = ? AND purpose = ?",
-        (token, purpose),
-    )
-    row = cur.fetchone()
+    now = int(time.time())
+    with conn:
+        # Expiry is checked in SQL so a valid token is looked up and removed in one statement
+        cur = conn.execute(
+            "DELETE FROM tokens WHERE token = ? AND purpose = ? AND (expires_ts IS NULL OR expires_ts > ?) RETURNING email",
+            (token, purpose, now),
+        )
+        row = cur.fetchone()
+        # Clear the token if it matched but had already expired
+        conn.execute("DELETE FROM tokens WHERE token = ? AND expires_ts <= ?", (token, now))
     if not row:
-        conn.close()
         return None
-    email = row["email"]
-    expires_at = row.get("expires_at")
-    try:
-        if expires_at:
-            exp_dt = datetime.fromisoformat(expires_at)
-            if exp_dt < datetime.utcnow():
-                cur.execute("DELETE FROM tokens WHERE token = ?", (token,))
-                conn.commit()
-                conn.close()
-                return None
-    except Exception:
-        cur.execute("DELETE FROM tokens WHERE token = ?", (token,))
-        conn.commit()
-        conn.close()
-        return None
-    cur.execute("DELETE FROM tokens WHERE token = ?", (token,))
-    conn.commit()
-    conn.close()
-    return email
+    return row["email"]
 
 def get_token_info(db_path, token, purpose):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT token, email, purpose, expires_at, created_at FROM tokens WHERE token = ? AND purpose = ?", (token, purpose))
+    cur = conn.execute(
+        "SELECT token, email, purpose, expires_at, created_at FROM tokens WHERE token = ? AND purpose = ? AND (expires_ts IS NULL OR expires_ts > ?)",
+        (token, purpose, int(time.time())),
+    )
     row = cur.fetchone()
-    conn.close()
-    if not row:
-        return None
-    expires_at = row.get("expires_at")
-    try:
-        if expires_at:
-            exp_dt = datetime.fromisoformat(expires_at)
-            if exp_dt < datetime.utcnow():
-                return None
-    except Exception:
-        return None
     return row
 
 def purge_expired_tokens(db_path):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    now = datetime.utcnow().isoformat()
-    cur.execute("DELETE FROM tokens WHERE expires_at <= ?", (now,))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute("DELETE FROM tokens WHERE expires_ts <= ?", (int(time.time()),))
+
+# Background purge: one daemon thread per db_path (so it reuses a single pooled
+# connection) that wakes every `interval` seconds.
+_PURGERS = {}
+_PURGERS_LOCK = threading.Lock()
+
+def start_token_purger(db_path, interval=600):
+    """
+    Starts a daemon thread that calls purge_expired_tokens every `interval` seconds.
+    Calling it again for the same db_path returns the already running thread.
+    Raises ValueError if interval is not positive (the thread would never sleep).
+    """
+    if interval <= 0:
+        raise ValueError("start_token_purger: interval must be positive, got %r" % (interval,))
+    with _PURGERS_LOCK:
+        running = _PURGERS.get(db_path)
+        if running is not None:
+            return running[0]
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    purge_expired_tokens(db_path)
+                except sqlite3.Error as e:
+                    print("models.start_token_purger: purge failed:", e)
+
+        thread = threading.Thread(target=run, name="token-purger", daemon=True)
+        _PURGERS[db_path] = (thread, stop)
+        thread.start()
+        return thread
+
+def stop_token_purger(db_path):
+    with _PURGERS_LOCK:
+        running = _PURGERS.pop(db_path, None)
+    if running is not None:
+        running[1].set()
 
 # Jobs
 def create_job(db_path, employer_id, title, description, location_text=None, lat=None, lng=None, salary="", tags=None):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        """INSERT INTO jobs
-           (employer_id, title, description, location_text, lat, lng, salary, tags, created_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (employer_id, title, description, location_text, lat, lng, salary, tags, datetime.utcnow().isoformat()),
-    )
-    conn.commit()
-    job_id = cur.lastrowid
-    conn.close()
-    return get_job_by_id(db_path, job_id)
+    with conn:
+        cur = conn.execute(
+            """INSERT INTO jobs
+               (employer_id, title, description, location_text, lat, lng, salary, tags, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+               RETURNING id, employer_id, title, description, location_text, lat, lng, salary, tags, created_at""",
+            (employer_id, title, description, location_text, lat, lng, salary, tags, datetime.utcnow().isoformat()),
+        )
+        row = cur.fetchone()
+    return row
+
+# Updatable job columns in SET order, and the UPDATE statement built for each
+# subset of them (filled lazily; at most 2**7 entries)
+_JOB_UPDATE_FIELDS = ("title", "description", "location_text", "lat", "lng", "salary", "tags")
+_JOB_UPDATE_SQL = {}
 
 def update_job(db_path, job_id, title=None, description=None, location_text=None, lat=None, lng=None, salary=None, tags=None):
-    conn = get_connection(db_path)
-    cur = conn.cursor()
-    fields = []
-    params = []
-    if title is not None:
-        fields.append("title = ?"); params.append(title)
-    if description is not None:
-        fields.append("description = ?"); params.append(description)
-    if location_text is not None:
-        fields.append("location_text = ?"); params.append(location_text)
-    if lat is not None:
-        fields.append("lat = ?"); params.append(lat)
-    if lng is not None:
-        fields.append("lng = ?"); params.append(lng)
-    if salary is not None:
-        fields.append("salary = ?"); params.append(salary)
-    if tags is not None:
-        fields.append("tags = ?"); params.append(tags)
-    if not fields:
-        conn.close()
+    values = (title, description, location_text, lat, lng, salary, tags)
+    present = tuple(name for name, value in zip(_JOB_UPDATE_FIELDS, values) if value is not None)
+    if not present:
         return get_job_by_id(db_path, job_id)
+    sql = _JOB_UPDATE_SQL.get(present)
+    if sql is None:
+        sql = "UPDATE jobs SET " + ", ".join(f"{name} = ?" for name in present) + " WHERE id = ?"
+        _JOB_UPDATE_SQL[present] = sql
+    params = [value for value in values if value is not None]
     params.append(job_id)
-    sql = "UPDATE jobs SET " + ", ".join(fields) + " WHERE id = ?"
-    cur.execute(sql, params)
-    conn.commit()
-    conn.close()
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute(sql, params)
+    _cache_discard(_JOB_CACHE, (db_path, job_id))
     return get_job_by_id(db_path, job_id)
 
 def delete_job(db_path, job_id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM applications WHERE job_id = ?", (job_id,))
-    cur.execute("DELETE FROM ratings WHERE target_type='job' AND target_id = ?", (job_id,))
-    cur.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute("DELETE FROM applications WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM ratings WHERE target_type='job' AND target_id = ?", (job_id,))
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+    _cache_discard(_JOB_CACHE, (db_path, job_id))
     return True
 
-def get_jobs(db_path, limit=None):
+def get_jobs(db_path, limit=None, before_created_at=None, before_id=None):
+    """
+    Returns jobs newest first (ties broken by id). To fetch the next page, pass the
+    created_at and id of the last job on the previous page as before_created_at and
+    before_id (keyset pagination, no OFFSET). before_created_at on its own skips
+    any remaining jobs that share that exact timestamp.
+    """
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    sql = "SELECT id, employer_id, title, description, location_text, lat, lng, salary, tags, created_at FROM jobs ORDER BY created_at DESC"
+    sql = "SELECT id, employer_id, title, description, location_text, lat, lng, salary, tags, created_at FROM jobs"
+    params = []
+    if before_created_at is not None and before_id is not None:
+        sql += " WHERE (created_at, id) < (?, ?)"
+        params.extend((before_created_at, before_id))
+    elif before_created_at is not None:
+        sql += " WHERE created_at < ?"
+        params.append(before_created_at)
+    sql += " ORDER BY created_at DESC, id DESC"
     if limit:
         sql += " LIMIT ?"
-        cur.execute(sql, (limit,))
-    else:
-        cur.execute(sql)
+        params.append(limit)
+    cur = conn.execute(sql, params)
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 def get_job_by_id(db_path, job_id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT id, employer_id, title, description, location_text, lat, lng, salary, tags, created_at FROM jobs WHERE id = ?", (job_id,))
+    cached = _cache_get(_JOB_CACHE, (db_path, job_id), conn)
+    if cached is not None:
+        return cached
+    version = _data_version(conn)
+    cur = conn.execute("SELECT id, employer_id, title, description, location_text, lat, lng, salary, tags, created_at FROM jobs WHERE id = ?", (job_id,))
     row = cur.fetchone()
-    conn.close()
+    if row:
+        _cache_put(_JOB_CACHE, (db_path, job_id), conn, version, row)
     return row
 
 def get_jobs_by_employer(db_path, employer_id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
+    cur = conn.execute(
         "SELECT id, employer_id, title, description, location_text, lat, lng, salary, tags, created_at FROM jobs WHERE employer_id = ? ORDER BY created_at DESC",
         (employer_id,),
     )
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 # Applications
 def create_application(db_path, job_id, user_id, cover_letter="", resume_text="", cover_letter_path=None, resume_path=None):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO applications (job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path, datetime.utcnow().isoformat()),
-    )
-    conn.commit()
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO applications (job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path, datetime.utcnow().isoformat()),
+        )
     app_id = cur.lastrowid
-    conn.close()
     return {"id": app_id, "job_id": job_id, "user_id": user_id, "cover_letter_path": cover_letter_path, "resume_path": resume_path}
 
+def create_applications_bulk(db_path, rows):
+    """
+    Inserts many applications in one transaction. Each row is
+    (job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path).
+    Returns the number of applications inserted.
+    """
+    now = datetime.utcnow().isoformat()
+    params = [tuple(r) + (now,) for r in rows]
+    if not params:
+        return 0
+    conn = get_connection(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO applications (job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            params,
+        )
+    return len(params)
+
 # and update get_applications_by_job to include the filename columns:
 def get_applications_by_job(db_path, job_id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
+    cur = conn.execute(
         "SELECT a.id, a.job_id, a.user_id, a.cover_letter, a.resume_text, a.cover_letter_path, a.resume_path, a.created_at, u.email as applicant_email FROM applications a JOIN users u ON u.id = a.user_id WHERE a.job_id = ? ORDER BY a.created_at DESC",
         (job_id,),
     )
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 
@@ -439,64 +641,104 @@ def get_applications_by_user(db_path, user_id):
     Returns applications for a given user. Each row includes cover_letter_path and resume_path where present.
     """
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
+    cur = conn.execute(
         "SELECT id, job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path, created_at FROM applications WHERE user_id = ? ORDER BY created_at DESC",
         (user_id,),
     )
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 # Ratings
+_RATING_TOTALS_SQL = "UPDATE {table} SET rating_sum = rating_sum + ?, rating_count = rating_count + ? WHERE id = ?"
+
+def _update_rating_totals(conn, target_type, target_id, rating_delta, count_delta):
+    table = _RATING_TARGET_TABLES.get(target_type)
+    if table is None:
+        return
+    conn.execute(_RATING_TOTALS_SQL.format(table=table), (rating_delta, count_delta, target_id))
+
 def create_rating(db_path, target_type, target_id, rater_id, rating, comment=""):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO ratings (target_type, target_id, rater_id, rating, comment, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-        (target_type, target_id, rater_id, rating, comment, datetime.utcnow().isoformat()),
-    )
-    conn.commit()
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO ratings (target_type, target_id, rater_id, rating, comment, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (target_type, target_id, rater_id, rating, comment, datetime.utcnow().isoformat()),
+        )
+        _update_rating_totals(conn, target_type, target_id, rating, 1)
     rid = cur.lastrowid
-    conn.close()
     return {"id": rid, "target_type": target_type, "target_id": target_id, "rater_id": rater_id, "rating": rating}
 
+def create_ratings_bulk(db_path, rows):
+    """
+    Inserts many ratings in one transaction. Each row is
+    (target_type, target_id, rater_id, rating, comment).
+    Returns the number of ratings inserted.
+    """
+    now = datetime.utcnow().isoformat()
+    params = [tuple(r) + (now,) for r in rows]
+    if not params:
+        return 0
+    conn = get_connection(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO ratings (target_type, target_id, rater_id, rating, comment, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            params,
+        )
+        # Sum the deltas per target first, then one executemany per target table
+        totals = {}
+        for target_type, target_id, _, rating, _, _ in params:
+            table = _RATING_TARGET_TABLES.get(target_type)
+            if table is None:
+                continue
+            per_target = totals.setdefault(table, {})
+            rating_sum, rating_count = per_target.get(target_id, (0, 0))
+            per_target[target_id] = (rating_sum + rating, rating_count + 1)
+        for table, per_target in totals.items():
+            conn.executemany(
+                _RATING_TOTALS_SQL.format(table=table),
+                [(rating_sum, rating_count, target_id) for target_id, (rating_sum, rating_count) in per_target.items()],
+            )
+    return len(params)
+
 def get_ratings_for_target(db_path, target_type, target_id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
+    cur = conn.execute(
         "SELECT r.id, r.target_type, r.target_id, r.rater_id, r.rating, r.comment, r.created_at, u.email as rater_email FROM ratings r JOIN users u ON u.id = r.rater_id WHERE r.target_type = ? AND r.target_id = ? ORDER BY r.created_at DESC",
         (target_type, target_id),
     )
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 def get_average_rating_for_target(db_path, target_type, target_id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT AVG(rating) as avg_rating, COUNT(*) as count FROM ratings WHERE target_type = ? AND target_id = ?",
-        (target_type, target_id),
-    )
+    table = _RATING_TARGET_TABLES.get(target_type)
+    if table is None:
+        cur = conn.execute(
+            "SELECT AVG(rating) as avg_rating, COUNT(*) as count FROM ratings WHERE target_type = ? AND target_id = ?",
+            (target_type, target_id),
+        )
+        row = cur.fetchone()
+        if not row:
+            return {"avg": None, "count": 0}
+        return {"avg": row.get("avg_rating"), "count": row.get("count")}
+    # Jobs and users carry running totals, so this is a primary-key lookup
+    cur = conn.execute(f"SELECT rating_sum, rating_count FROM {table} WHERE id = ?", (target_id,))
     row = cur.fetchone()
-    conn.close()
-    if not row:
+    if not row or not row["rating_count"]:
         return {"avg": None, "count": 0}
-    return {"avg": row.get("avg_rating"), "count": row.get("count")}
+    return {"avg": row["rating_sum"] / row["rating_count"], "count": row["rating_count"]}
 
 def get_rating_by_id(db_path, rating_id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT id, target_type, target_id, rater_id, rating, comment, created_at FROM ratings WHERE id = ?", (rating_id,))
+    cur = conn.execute("SELECT id, target_type, target_id, rater_id, rating, comment, created_at FROM ratings WHERE id = ?", (rating_id,))
     row = cur.fetchone()
-    conn.close()
     return row
 
 def delete_rating(db_path, rating_id):
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM ratings WHERE id = ?", (rating_id,))
-    conn.commit()
-    conn.close()
+    with conn:
+        cur = conn.execute("DELETE FROM ratings WHERE id = ? RETURNING target_type, target_id, rating", (rating_id,))
+        row = cur.fetchone()
+        if row:
+            _update_rating_totals(conn, row["target_type"], row["target_id"], -row["rating"], -1)
     return True